@@ -1,17 +1,27 @@
 """
 Vehicle Tracking System - Flask Client
 Sends vehicle events to ActiveMQ Artemis via STOMP protocol
+
+Served by gevent: sockets, threads and queues below are cooperative once
+patched, so the STOMP sender pool and metrics refresher run as greenlets.
+Production runs under gunicorn's gevent worker (see Dockerfile).
 """
 
+from gevent import monkey
+monkey.patch_all()
+
 import os
-import json
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import threading
 import time
-from datetime import datetime
-from uuid import uuid4
+from datetime import datetime, timezone
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request
+import orjson
 import stomp
+from stomp.exception import NotConnectedException
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
 # Configuration
@@ -21,7 +31,18 @@ CONFIG = {
         'port': int(os.environ.get('ARTEMIS_PORT', 61613)),  # STOMP port
         'user': os.environ.get('ARTEMIS_USER', 'admin'),
         'password': os.environ.get('ARTEMIS_PASSWORD', 'admin'),
-        'queue': os.environ.get('ARTEMIS_QUEUE', 'vehicle.events')
+        'queue': os.environ.get('ARTEMIS_QUEUE', 'vehicle.events'),
+        # Telemetry is fire-and-forget by default: no broker fsync per message
+        'persistent': os.environ.get('ARTEMIS_PERSISTENT', 'false').lower() == 'true'
+    },
+    'sender': {
+        'threads': int(os.environ.get('STOMP_SENDER_THREADS', os.cpu_count() or 1)),
+        'queue_size': int(os.environ.get('STOMP_SENDER_QUEUE_SIZE', 10000)),
+        'batch_size': int(os.environ.get('STOMP_SENDER_BATCH_SIZE', 256)),
+        'linger_ms': int(os.environ.get('STOMP_SENDER_LINGER_MS', 10))
+    },
+    'metrics': {
+        'refresh_seconds': float(os.environ.get('METRICS_REFRESH_SECONDS', 5))
     },
     'server': {
         'host': '0.0.0.0',
@@ -31,15 +52,52 @@ CONFIG = {
 }
 
 # Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Records are handed to a queue and written by a background listener, so
+# request handlers never block on stream I/O
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_queue = queue.SimpleQueue()
+_queue_handler = QueueHandler(_log_queue)
+# Only the listener's handler adds the prefix; the queued record carries
+# just the message (basicConfig would otherwise install its default format)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
 logger = logging.getLogger(__name__)
 
 # Flask App
 app = Flask(__name__)
 
+# JSON encoding (orjson handles datetime natively; naive datetimes are UTC)
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC
+
+
+class ORJSONResponse(Response):
+    """Response carrying a body already encoded by orjson."""
+    default_mimetype = 'application/json'
+
+
+def ojsonify(*args, **kwargs):
+    """Drop-in replacement for flask.jsonify backed by orjson."""
+    obj = args[0] if args else kwargs
+    return ORJSONResponse(orjson.dumps(obj, option=ORJSON_OPTIONS))
+
+
+# Timestamps: one ISO-8601 string shared by every caller within a millisecond
+_ts_cache = (0, '')
+
+
+def iso_now():
+    """Current UTC time in ISO-8601, cached at millisecond resolution."""
+    global _ts_cache
+    ms = time.time_ns() // 1_000_000
+    cached_ms, iso = _ts_cache
+    if ms != cached_ms:
+        iso = datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec='milliseconds')
+        _ts_cache = (ms, iso)
+    return iso
+
 # Prometheus Metrics
 messages_sent = Counter(
     'client_flask_messages_sent_total',
@@ -51,51 +109,316 @@ messages_failed = Counter(
 )
 send_latency = Histogram(
     'client_flask_send_latency_seconds',
-    'Message send latency',
+    'Message send latency, from request enqueue to broker commit',
     buckets=[0.01, 0.05, 0.1, 0.5, 1, 2, 5]
 )
 
+# Prometheus exposition is rendered off the request path; scrapes get the
+# latest snapshot (the default scrape interval is well above the refresh)
+_metrics_cache = (b'', 0.0)
+
+
+def _refresh_metrics():
+    global _metrics_cache
+    while True:
+        try:
+            _metrics_cache = (generate_latest(), time.time())
+        except Exception as e:
+            logger.error("Failed to render metrics: %s", e)
+        time.sleep(CONFIG['metrics']['refresh_seconds'])
+
+threading.Thread(target=_refresh_metrics, name='metrics-refresh', daemon=True).start()
+
 # STOMP Connection
+class _ConnectionListener(stomp.ConnectionListener):
+    """Keeps StompConnection.connected in sync with the transport."""
+    
+    def __init__(self, owner, conn):
+        self.owner = owner
+        self.conn = conn
+    
+    def _lost(self):
+        # Ignore late callbacks from a connection that has been replaced
+        if self.owner.conn is self.conn:
+            self.owner.connected = False
+    
+    def on_disconnected(self):
+        self._lost()
+    
+    def on_heartbeat_timeout(self):
+        self._lost()
+    
+    def on_error(self, frame):
+        self._lost()
+
+
 class StompConnection:
     def __init__(self):
         self.conn = None
         self.connected = False
+        self.destination = f"/queue/{CONFIG['artemis']['queue']}"
+        self.headers = {'persistent': 'true' if CONFIG['artemis']['persistent'] else 'false'}
     
     def connect(self):
+        if self.conn is not None:
+            # An ERROR frame can leave the old socket open; release it and its
+            # receiver thread before replacing the connection
+            try:
+                self.conn.disconnect()
+            except Exception:
+                pass
         try:
             self.conn = stomp.Connection(
                 [(CONFIG['artemis']['host'], CONFIG['artemis']['port'])],
                 heartbeats=(10000, 10000)
             )
+            self.conn.set_listener('state', _ConnectionListener(self, self.conn))
             self.conn.connect(
                 CONFIG['artemis']['user'],
                 CONFIG['artemis']['password'],
                 wait=True
             )
             self.connected = True
-            logger.info(f"Connected to Artemis at {CONFIG['artemis']['host']}:{CONFIG['artemis']['port']}")
+            logger.info("Connected to Artemis at %s:%s", CONFIG['artemis']['host'], CONFIG['artemis']['port'])
         except Exception as e:
             self.connected = False
-            logger.error(f"Failed to connect to Artemis: {e}")
+            logger.error("Failed to connect to Artemis: %s", e)
             raise
     
-    def send(self, message):
-        if not self.connected or not self.conn.is_connected():
+    def send(self, body):
+        """Send one JSON-encoded message body."""
+        self._with_reconnect(self._send_one, body)
+    
+    def send_batch(self, bodies):
+        """Send several JSON-encoded bodies inside a single STOMP transaction."""
+        self._with_reconnect(self._send_transaction, bodies)
+    
+    def _with_reconnect(self, send, payload):
+        # The listener clears `connected`, so no is_connected() poll per send
+        if not self.connected:
             self.connect()
-        
-        destination = f"/queue/{CONFIG['artemis']['queue']}"
+        try:
+            send(payload)
+        except NotConnectedException:
+            # The socket dropped before the listener noticed; retry once
+            self.connected = False
+            self.connect()
+            send(payload)
+    
+    def _send_one(self, body):
         self.conn.send(
-            destination=destination,
-            body=json.dumps(message),
-            content_type='application/json'
+            destination=self.destination,
+            body=body,
+            content_type='application/json',
+            headers=self.headers
         )
     
+    def _send_transaction(self, bodies):
+        transaction = self.conn.begin()
+        for body in bodies:
+            self.conn.send(
+                destination=self.destination,
+                body=body,
+                content_type='application/json',
+                headers=self.headers,
+                transaction=transaction
+            )
+        self.conn.commit(transaction)
+    
     def disconnect(self):
         if self.conn and self.conn.is_connected():
             self.conn.disconnect()
             self.connected = False
 
-stomp_conn = StompConnection()
+
+class StompSender(threading.Thread):
+    """Drains the shared outbound queue over its own STOMP connection.
+
+    Queue items are ``(enqueued_at, bodies)`` pairs, one per request.
+    Pending items are coalesced into batches of roughly ``batch_size``
+    frames or ``linger`` seconds, whichever comes first, and each batch is
+    delivered in a single STOMP transaction. An item is never split across
+    transactions.
+    """
+    
+    def __init__(self, outbox, batch_size, linger):
+        super().__init__(daemon=True)
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.linger = linger
+        self.stomp_conn = StompConnection()
+    
+    def run(self):
+        try:
+            self.stomp_conn.connect()
+        except Exception as e:
+            logger.warning("Initial connection failed, will retry: %s", e)
+        
+        running = True
+        while running:
+            item = self.outbox.get()
+            if item is None:
+                break
+            enqueued = [item[0]]
+            batch = list(item[1])
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.outbox.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                enqueued.append(item[0])
+                batch.extend(item[1])
+            self.flush(batch, enqueued)
+        
+        self.stomp_conn.disconnect()
+    
+    def flush(self, batch, enqueued):
+        try:
+            if len(batch) == 1:
+                self.stomp_conn.send(batch[0])
+            else:
+                self.stomp_conn.send_batch(batch)
+            messages_sent.inc(len(batch))
+            # One sample per request, enqueue to broker commit; observed here
+            # on the sender thread, so the histogram lock stays off requests
+            committed_at = time.monotonic()
+            for enqueued_at in enqueued:
+                send_latency.observe(committed_at - enqueued_at)
+        except Exception as e:
+            messages_failed.inc(len(batch))
+            logger.error("Failed to send %d event(s): %s", len(batch), e)
+
+
+class StompSenderPool:
+    """Bounded queue of pending requests shared by StompSender threads.
+
+    Request handlers only enqueue; the sender threads own every STOMP
+    connection, so no connection is ever touched by more than one thread.
+    """
+    
+    def __init__(self, threads, queue_size, batch_size, linger_ms):
+        self.outbox = queue.Queue(maxsize=queue_size)
+        self.senders = [
+            StompSender(self.outbox, batch_size, linger_ms / 1000)
+            for _ in range(max(threads, 1))
+        ]
+        self._lock = threading.Lock()
+        self._started = False
+    
+    @property
+    def connected(self):
+        return any(s.stomp_conn.connected for s in self.senders)
+    
+    def start(self):
+        with self._lock:
+            if not self._started:
+                for s in self.senders:
+                    s.start()
+                self._started = True
+    
+    def enqueue(self, message):
+        """Queue an encoded body for delivery; raises queue.Full when saturated."""
+        self.enqueue_batch([message])
+    
+    def enqueue_batch(self, messages):
+        """Queue encoded bodies to be delivered together in one transaction."""
+        if not self._started:
+            self.start()
+        self.outbox.put_nowait((time.monotonic(), messages))
+    
+    def stop(self, timeout=5):
+        if not self._started:
+            return
+        # One sentinel per thread; pending messages ahead of them are flushed
+        for _ in self.senders:
+            try:
+                self.outbox.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for s in self.senders:
+            s.join(timeout)
+
+sender = StompSenderPool(**CONFIG['sender'])
+# Connect at boot so /api/status is accurate before the first send. gunicorn
+# imports the app in each worker after forking (no --preload), so the
+# sender threads belong to the worker that serves requests.
+sender.start()
+
+# Shape of every event; handlers copy it and fill in the per-request values
+_EVENT_TEMPLATE = {
+    'id': None,
+    'licensePlate': None,
+    'vehicleType': None,
+    'eventType': None,
+    'source': 'flask-client',
+    'timestamp': None
+}
+OPTIONAL_EVENT_FIELDS = ('latitude', 'longitude', 'speed', 'direction')
+
+
+def pick(d, key, alt_key, default):
+    """d[key], falling back to d[alt_key] and then default.
+
+    Unlike d.get(key, d.get(alt_key, default)) the fallback lookup only
+    runs when the primary key is missing or null.
+    """
+    value = d.get(key)
+    return value if value is not None else d.get(alt_key, default)
+
+
+class _IdPool:
+    """Hands out 128-bit random hex ids sliced from one urandom read."""
+    
+    def __init__(self, size=4096):
+        self.size = size
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        self.buf = b''
+        self.off = 0
+    
+    def take(self):
+        with self.lock:
+            if self.off + 16 > len(self.buf):
+                self.buf = os.urandom(self.size)
+                self.off = 0
+            chunk = self.buf[self.off:self.off + 16]
+            self.off += 16
+        return chunk.hex()
+
+_idpool = _IdPool()
+# A forked worker must not replay the parent's buffered bytes as ids
+os.register_at_fork(after_in_child=_idpool.reset)
+
+# Pre-encoded bodies for endpoints whose content rarely changes
+_HEALTH_RESP = (
+    orjson.dumps({'status': 'UP', 'service': 'client-flask'}),
+    200,
+    {'Content-Type': 'application/json'}
+)
+
+
+def _status_prefix(connected):
+    # Encoded status without its closing brace, ready for the timestamp
+    body = orjson.dumps({
+        'service': 'client-flask',
+        'artemis_connected': connected,
+        'artemis_host': CONFIG['artemis']['host'],
+        'artemis_port': CONFIG['artemis']['port'],
+        'queue': CONFIG['artemis']['queue']
+    })
+    return body[:-1] + b',"timestamp":"'
+
+# Connection state is the only varying field, so both variants are encoded once
+_STATUS_PREFIX = {True: _status_prefix(True), False: _status_prefix(False)}
 
 # Routes
 @app.route('/')
@@ -104,65 +427,74 @@ def index():
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'UP', 'service': 'client-flask'})
+    return _HEALTH_RESP
 
 @app.route('/metrics')
 def metrics():
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    body, rendered_at = _metrics_cache
+    if not rendered_at:
+        # First scrape raced the refresher; render inline once
+        body = generate_latest()
+    return body, 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 @app.route('/api/status')
 def status():
-    return jsonify({
-        'service': 'client-flask',
-        'artemis_connected': stomp_conn.connected,
-        'artemis_host': CONFIG['artemis']['host'],
-        'artemis_port': CONFIG['artemis']['port'],
-        'queue': CONFIG['artemis']['queue'],
-        'timestamp': datetime.utcnow().isoformat()
-    })
+    # iso_now() is plain ASCII, so it can be spliced in without escaping
+    body = _STATUS_PREFIX[sender.connected] + iso_now().encode() + b'"}'
+    return ORJSONResponse(body)
 
 @app.route('/api/send', methods=['POST'])
 def send_event():
-    start_time = time.time()
+    try:
+        raw = request.get_data(cache=False)
+        # Falsy bodies ({}, null, []) mean "all defaults", as with get_json() or {}
+        data = (orjson.loads(raw) if raw else None) or {}
+    except orjson.JSONDecodeError as e:
+        return ojsonify({'success': False, 'error': f'Invalid JSON: {e}'}), 400
+    if not isinstance(data, dict):
+        return ojsonify({'success': False, 'error': 'Event must be a JSON object'}), 400
     
     try:
-        data = request.get_json() or {}
-        
         # Build event
-        event = {
-            'id': str(uuid4()),
-            'licensePlate': data.get('licensePlate', data.get('license_plate', 'UNKNOWN')),
-            'vehicleType': data.get('vehicleType', data.get('vehicle_type', 'CAR')),
-            'eventType': data.get('eventType', data.get('event_type', 'DETECTION')),
-            'latitude': data.get('latitude'),
-            'longitude': data.get('longitude'),
-            'speed': data.get('speed'),
-            'direction': data.get('direction'),
-            'source': 'flask-client',
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        event = _EVENT_TEMPLATE.copy()
+        event['id'] = _idpool.take()
+        event['licensePlate'] = pick(data, 'licensePlate', 'license_plate', 'UNKNOWN')
+        event['vehicleType'] = pick(data, 'vehicleType', 'vehicle_type', 'CAR')
+        event['eventType'] = pick(data, 'eventType', 'event_type', 'DETECTION')
+        event['timestamp'] = iso_now()
         
-        # Remove None values
-        event = {k: v for k, v in event.items() if v is not None}
+        # Optional fields are only included when provided
+        for key in OPTIONAL_EVENT_FIELDS:
+            value = data.get(key)
+            if value is not None:
+                event[key] = value
         
-        # Send to Artemis
-        stomp_conn.send(event)
+        # Encode once: the same bytes go to Artemis and into the response
+        body = orjson.dumps(event, option=ORJSON_OPTIONS)
         
-        messages_sent.inc()
-        send_latency.observe(time.time() - start_time)
+        # Hand off to the sender pool; delivery happens in the background
+        sender.enqueue(body)
         
-        logger.info(f"Sent event for plate: {event['licensePlate']}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Queued event for plate: %s", event['licensePlate'])
         
-        return jsonify({
+        return ojsonify({
             'success': True,
-            'event': event,
-            'message': 'Event sent successfully'
+            'event': orjson.Fragment(body),
+            'message': 'Event queued for delivery'
         })
         
+    except queue.Full:
+        messages_failed.inc()
+        logger.error("Failed to queue event: send queue is full")
+        return ojsonify({
+            'success': False,
+            'error': 'Send queue is full'
+        }), 503
     except Exception as e:
         messages_failed.inc()
-        logger.error(f"Failed to send event: {e}")
-        return jsonify({
+        logger.error("Failed to send event: %s", e)
+        return ojsonify({
             'success': False,
             'error': str(e)
         }), 500
@@ -170,51 +502,68 @@ def send_event():
 @app.route('/api/send/batch', methods=['POST'])
 def send_batch():
     try:
-        events = request.get_json() or []
-        
+        raw = request.get_data(cache=False)
+        # Falsy bodies ({}, null, []) are an empty batch, as with get_json() or []
+        events = (orjson.loads(raw) if raw else None) or []
+    except orjson.JSONDecodeError as e:
+        return ojsonify({'error': f'Invalid JSON: {e}'}), 400
+    
+    try:
         if not isinstance(events, list):
             events = [events]
         
-        results = []
-        for event_data in events:
+        if not all(isinstance(e, dict) for e in events):
+            return ojsonify({'error': 'Each event must be a JSON object'}), 400
+        
+        # All events in one request share the same timestamp
+        now = iso_now()
+        events = [
+            {
+                'id': _idpool.take(),
+                'licensePlate': e.get('licensePlate', 'UNKNOWN'),
+                'vehicleType': e.get('vehicleType', 'CAR'),
+                'eventType': e.get('eventType', 'DETECTION'),
+                'source': 'flask-client',
+                'timestamp': now
+            }
+            for e in events
+        ]
+        
+        # The whole request goes out in a single STOMP transaction
+        if events:
             try:
-                event = {
-                    'id': str(uuid4()),
-                    'licensePlate': event_data.get('licensePlate', 'UNKNOWN'),
-                    'vehicleType': event_data.get('vehicleType', 'CAR'),
-                    'eventType': event_data.get('eventType', 'DETECTION'),
-                    'source': 'flask-client',
-                    'timestamp': datetime.utcnow().isoformat()
-                }
-                stomp_conn.send(event)
-                messages_sent.inc()
-                results.append({'success': True, 'licensePlate': event['licensePlate']})
-            except Exception as e:
-                messages_failed.inc()
-                results.append({'success': False, 'error': str(e)})
+                sender.enqueue_batch([orjson.dumps(e, option=ORJSON_OPTIONS) for e in events])
+            except queue.Full:
+                messages_failed.inc(len(events))
+                return ojsonify({
+                    'total': len(events),
+                    'successful': 0,
+                    'error': 'Send queue is full'
+                }), 503
         
-        return jsonify({
+        return ojsonify({
             'total': len(events),
-            'successful': sum(1 for r in results if r.get('success')),
-            'results': results
+            'successful': len(events),
+            'results': [{'success': True, 'licensePlate': e['licensePlate']} for e in events]
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 # Cleanup on shutdown
 import atexit
-atexit.register(stomp_conn.disconnect)
+# atexit runs in reverse order: drain the senders, then flush their logs
+atexit.register(_log_listener.stop)
+atexit.register(sender.stop)
 
 if __name__ == '__main__':
-    # Initial connection
-    try:
-        stomp_conn.connect()
-    except Exception as e:
-        logger.warning(f"Initial connection failed, will retry: {e}")
-    
-    app.run(
-        host=CONFIG['server']['host'],
-        port=CONFIG['server']['port'],
-        debug=CONFIG['server']['debug']
-    )
+    if CONFIG['server']['debug']:
+        app.run(
+            host=CONFIG['server']['host'],
+            port=CONFIG['server']['port'],
+            debug=True
+        )
+    else:
+        from gevent.pywsgi import WSGIServer
+        logger.info("Serving on %s:%s", CONFIG['server']['host'], CONFIG['server']['port'])
+        WSGIServer((CONFIG['server']['host'], CONFIG['server']['port']), app).serve_forever()
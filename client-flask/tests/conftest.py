@@ -0,0 +1,92 @@
+"""Shared fixtures for the Flask client tests."""
+import os
+import queue
+import sys
+import time
+
+# The app starts its sender pool at import; keep it to one thread aimed at a
+# closed port so it never reaches a real broker
+os.environ.setdefault('STOMP_SENDER_THREADS', '1')
+os.environ.setdefault('ARTEMIS_HOST', '127.0.0.1')
+os.environ.setdefault('ARTEMIS_PORT', '1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as client_app
+
+
+class FakeStompConnection:
+    """Stands in for StompConnection; records each delivered transaction."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.connected = False
+        self.calls = []
+
+    def connect(self):
+        self.connected = True
+
+    def send(self, body):
+        self.send_batch([body])
+
+    def send_batch(self, bodies):
+        if self.fail:
+            raise ConnectionError('broker unavailable')
+        self.calls.append(list(bodies))
+
+    def disconnect(self):
+        self.connected = False
+
+
+class FakeSenderPool:
+    """Stands in for StompSenderPool; keeps what handlers enqueue."""
+
+    def __init__(self, full=False):
+        self.full = full
+        self.connected = True
+        self.items = []
+
+    def enqueue(self, message):
+        self.enqueue_batch([message])
+
+    def enqueue_batch(self, messages):
+        if self.full:
+            raise queue.Full
+        self.items.append(list(messages))
+
+
+def item(*bodies):
+    """A queue item as StompSenderPool.enqueue_batch would produce it."""
+    return (time.monotonic(), list(bodies))
+
+
+@pytest.fixture
+def make_sender():
+    """Build StompSenders wired to a FakeStompConnection; stopped on teardown."""
+    senders = []
+
+    def make(outbox, batch_size=256, linger=5.0, fail=False):
+        s = client_app.StompSender(outbox, batch_size, linger)
+        s.stomp_conn = FakeStompConnection(fail=fail)
+        senders.append(s)
+        return s
+
+    yield make
+    for s in senders:
+        if s.is_alive():
+            s.outbox.put(None)
+            s.join(5)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = FakeSenderPool()
+    monkeypatch.setattr(client_app, 'sender', fake)
+    return fake
+
+
+@pytest.fixture
+def client(pool):
+    return client_app.app.test_client()
@@ -0,0 +1,103 @@
+"""Request parsing and queue hand-off for /api/send and /api/send/batch."""
+import orjson
+import pytest
+
+from conftest import FakeSenderPool
+
+import app as client_app
+
+
+@pytest.mark.parametrize('body', [b'', b'null', b'{}', b'[]'])
+def test_send_empty_or_falsy_body_uses_defaults(client, pool, body):
+    resp = client.post('/api/send', data=body, content_type='application/json')
+
+    assert resp.status_code == 200
+    event = resp.get_json()['event']
+    assert event['licensePlate'] == 'UNKNOWN'
+    assert event['vehicleType'] == 'CAR'
+    assert event['eventType'] == 'DETECTION'
+    assert len(pool.items) == 1
+
+
+def test_send_enqueues_the_body_returned_in_the_response(client, pool):
+    resp = client.post('/api/send', json={'license_plate': 'ABC-1234', 'speed': 60, 'direction': None})
+
+    assert resp.status_code == 200
+    event = resp.get_json()['event']
+    assert event['licensePlate'] == 'ABC-1234'
+    assert event['speed'] == 60
+    assert 'direction' not in event
+    assert orjson.loads(pool.items[0][0]) == event
+
+
+def test_send_malformed_json_is_rejected(client, pool):
+    resp = client.post('/api/send', data=b'{"licensePlate":', content_type='application/json')
+
+    assert resp.status_code == 400
+    assert resp.get_json()['success'] is False
+    assert pool.items == []
+
+
+@pytest.mark.parametrize('body', [b'[1]', b'"ABC-1234"', b'42'])
+def test_send_non_object_is_rejected(client, pool, body):
+    resp = client.post('/api/send', data=body, content_type='application/json')
+
+    assert resp.status_code == 400
+    assert pool.items == []
+
+
+def test_send_full_queue_returns_503(client, monkeypatch):
+    monkeypatch.setattr(client_app, 'sender', FakeSenderPool(full=True))
+
+    resp = client.post('/api/send', json={'licensePlate': 'ABC-1234'})
+
+    assert resp.status_code == 503
+    assert resp.get_json() == {'success': False, 'error': 'Send queue is full'}
+
+
+@pytest.mark.parametrize('body', [b'', b'null', b'{}', b'[]'])
+def test_batch_empty_or_falsy_body_sends_nothing(client, pool, body):
+    resp = client.post('/api/send/batch', data=body, content_type='application/json')
+
+    assert resp.status_code == 200
+    assert resp.get_json()['total'] == 0
+    assert pool.items == []
+
+
+def test_batch_enqueues_all_events_as_one_item(client, pool):
+    resp = client.post('/api/send/batch', json=[{'licensePlate': 'A'}, {'licensePlate': 'B'}])
+
+    assert resp.status_code == 200
+    assert resp.get_json()['successful'] == 2
+    assert len(pool.items) == 1
+    assert [orjson.loads(b)['licensePlate'] for b in pool.items[0]] == ['A', 'B']
+
+
+def test_batch_single_object_is_wrapped(client, pool):
+    resp = client.post('/api/send/batch', json={'licensePlate': 'A'})
+
+    assert resp.status_code == 200
+    assert resp.get_json()['total'] == 1
+
+
+def test_batch_malformed_json_is_rejected(client, pool):
+    resp = client.post('/api/send/batch', data=b'[{"licensePlate":', content_type='application/json')
+
+    assert resp.status_code == 400
+    assert pool.items == []
+
+
+def test_batch_non_object_entry_is_rejected(client, pool):
+    resp = client.post('/api/send/batch', json=[{'licensePlate': 'A'}, 1])
+
+    assert resp.status_code == 400
+    assert pool.items == []
+
+
+def test_batch_full_queue_returns_503(client, monkeypatch):
+    monkeypatch.setattr(client_app, 'sender', FakeSenderPool(full=True))
+
+    resp = client.post('/api/send/batch', json=[{'licensePlate': 'A'}, {'licensePlate': 'B'}])
+
+    assert resp.status_code == 503
+    assert resp.get_json()['successful'] == 0
@@ -0,0 +1,103 @@
+"""StompSender batching, shutdown and failure accounting."""
+import queue
+import time
+
+from prometheus_client import REGISTRY
+
+import app as client_app
+from conftest import FakeStompConnection, item
+
+
+def sample(name):
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+def test_coalescing_stops_at_batch_size_without_splitting_items(make_sender):
+    outbox = queue.Queue()
+    outbox.put(item(b'a', b'b'))
+    outbox.put(item(b'c', b'd'))
+    outbox.put(item(b'e'))
+    outbox.put(None)
+
+    s = make_sender(outbox, batch_size=3)
+    s.start()
+    s.join(5)
+
+    # The second item overshoots batch_size rather than being split
+    assert s.stomp_conn.calls == [[b'a', b'b', b'c', b'd'], [b'e']]
+
+
+def test_linger_deadline_flushes_partial_batch(make_sender):
+    outbox = queue.Queue()
+    s = make_sender(outbox, batch_size=100, linger=0.05)
+    s.start()
+    outbox.put(item(b'a'))
+
+    deadline = time.monotonic() + 2
+    while not s.stomp_conn.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert s.stomp_conn.calls == [[b'a']]
+    assert s.is_alive()
+
+
+def test_stop_drains_pending_items_before_threads_exit():
+    pool = client_app.StompSenderPool(threads=2, queue_size=100, batch_size=2, linger_ms=1000)
+    for s in pool.senders:
+        s.stomp_conn = FakeStompConnection()
+    bodies = [f'event-{i}'.encode() for i in range(7)]
+    for body in bodies:
+        pool.outbox.put(item(body))
+
+    pool.start()
+    pool.stop()
+
+    assert not any(s.is_alive() for s in pool.senders)
+    sent = [body for s in pool.senders for call in s.stomp_conn.calls for body in call]
+    assert sorted(sent) == sorted(bodies)
+
+
+def test_successful_flush_records_one_latency_sample_per_request(make_sender):
+    sent_before = sample('client_flask_messages_sent_total')
+    latency_before = sample('client_flask_send_latency_seconds_count')
+    outbox = queue.Queue()
+    outbox.put(item(b'a', b'b'))
+    outbox.put(item(b'c'))
+    outbox.put(None)
+
+    s = make_sender(outbox)
+    s.start()
+    s.join(5)
+
+    assert sample('client_flask_messages_sent_total') - sent_before == 3
+    assert sample('client_flask_send_latency_seconds_count') - latency_before == 2
+
+
+def test_failed_send_counts_failures_and_records_no_latency(make_sender):
+    failed_before = sample('client_flask_messages_failed_total')
+    sent_before = sample('client_flask_messages_sent_total')
+    latency_before = sample('client_flask_send_latency_seconds_count')
+    outbox = queue.Queue()
+    outbox.put(item(b'a', b'b'))
+    outbox.put(None)
+
+    s = make_sender(outbox, fail=True)
+    s.start()
+    s.join(5)
+
+    assert sample('client_flask_messages_failed_total') - failed_before == 2
+    assert sample('client_flask_messages_sent_total') == sent_before
+    assert sample('client_flask_send_latency_seconds_count') == latency_before
+
+
+def test_listener_ignores_callbacks_from_replaced_connection():
+    owner = client_app.StompConnection()
+    old_conn, new_conn = object(), object()
+    owner.conn = new_conn
+    owner.connected = True
+
+    client_app._ConnectionListener(owner, old_conn).on_disconnected()
+    assert owner.connected
+
+    client_app._ConnectionListener(owner, new_conn).on_error(None)
+    assert not owner.connected